@@ -0,0 +1,309 @@
+import codecs
+import os
+import threading
+import pandas as pd
+
+# Kolone koje postoje i u ACCIDENT i u PERSON; za spajanje se koriste one iz ACCIDENT
+CONFLICTING_COLS = ["MONTH", "HOUR", "STATE", "YEAR", "DAY"]
+PROFILE_COLS = ["SEX", "AGE", "MONTH", "HOUR"]
+NUMERIC_COLS = ["ST_CASE", "STATE", "DRINKING", "SEX", "AGE", "MONTH", "HOUR"]
+
+
+class DataUnavailable(Exception):
+    pass
+
+
+def find_table_path(base_folder, year, table):
+    # Parquet ima prednost pred CSV-om ako postoji
+    for ext in ("parquet", "csv"):
+        path = os.path.join(base_folder, str(year), f"{table}.{ext}")
+        if os.path.exists(path):
+            return path
+    return None
+
+
+def detect_csv_encoding(path):
+    # Fallback na latin-1 (za starije godine), isto kao cp1252 u pandas backendu
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    with open(path, "rb") as f:
+        try:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                decoder.decode(chunk)
+            decoder.decode(b"", final=True)
+        except UnicodeDecodeError:
+            return "latin-1"
+    return "utf-8"
+
+
+def int_col(alias, col):
+    # Neke godine imaju tekstualne vrijednosti u brojčanim kolonama; one postaju NULL
+    return f"TRY_CAST({alias}.{col} AS BIGINT)"
+
+
+def list_years(base_folder):
+    years = []
+    for year_folder in os.listdir(base_folder):
+        try:
+            year = int(year_folder)
+        except ValueError:
+            continue
+        if os.path.isdir(os.path.join(base_folder, year_folder)):
+            years.append(year)
+    return sorted(years)
+
+
+class PandasBackend:
+    def __init__(self, base_folder):
+        self.base_folder = base_folder
+
+    def years(self):
+        return list_years(self.base_folder)
+
+    def load_table(self, year, table):
+        path = find_table_path(self.base_folder, year, table)
+        if path is None:
+            return None
+
+        if path.endswith(".parquet"):
+            try:
+                df = pd.read_parquet(path)
+            except Exception as e:
+                print(f"Error loading {path}: {e}")
+                return None
+        else:
+            try:
+                df = pd.read_csv(path, encoding="utf-8-sig", low_memory=False)
+            except UnicodeDecodeError:
+                try:
+                    # Fallback na cp1252 (za starije godine)
+                    df = pd.read_csv(path, encoding="cp1252", low_memory=False)
+                except Exception as e2:
+                    print(f"Error loading {path} with both encodings: {e2}")
+                    return None
+            except Exception as e:
+                print(f"Error loading {path}: {e}")
+                return None
+
+        print(f"Loaded {table} for {year}, shape: {df.shape}")
+        return df
+
+    def columns(self, year, table):
+        path = find_table_path(self.base_folder, year, table)
+        if path is None:
+            return None
+
+        if path.endswith(".parquet"):
+            import pyarrow.parquet as pq
+            names = pq.read_schema(path).names
+        else:
+            try:
+                names = pd.read_csv(path, nrows=0, encoding="utf-8-sig").columns.tolist()
+            except UnicodeDecodeError:
+                names = pd.read_csv(path, nrows=0, encoding="cp1252").columns.tolist()
+        return [col.replace('\ufeff', '') for col in names]
+
+    def load_merged(self, year):
+        accident_df = self.load_table(year, "ACCIDENT")
+        person_df = self.load_table(year, "PERSON")
+        if accident_df is None or person_df is None:
+            raise DataUnavailable(f"Data for year {year} not found.")
+
+        if "ST_CASE" not in accident_df.columns or "ST_CASE" not in person_df.columns:
+            raise DataUnavailable(f"ST_CASE column missing for year {year}.")
+        if "STATE" not in accident_df.columns:
+            raise DataUnavailable(f"STATE column missing in ACCIDENT data for {year}.")
+        if "DRINKING" not in person_df.columns:
+            raise DataUnavailable(f"DRINKING column missing for year {year}.")
+
+        person_df = person_df.drop(columns=[c for c in CONFLICTING_COLS if c in person_df.columns])
+        # tekstualne vrijednosti u brojčanim kolonama postaju NaN, kao TRY_CAST u DuckDB backendu
+        for df in (accident_df, person_df):
+            for col in NUMERIC_COLS:
+                if col in df.columns:
+                    df[col] = pd.to_numeric(df[col], errors="coerce")
+        return pd.merge(accident_df, person_df, on="ST_CASE", how="inner")
+
+    def filter_persons(self, df, state_id=None, min_age=None, max_age=None, sex=None):
+        if state_id is not None:
+            df = df[df["STATE"] == state_id]
+        if min_age is not None:
+            df = df[df["AGE"] >= min_age]
+        if max_age is not None:
+            df = df[df["AGE"] <= max_age]
+        if sex is not None:
+            df = df[df["SEX"] == sex]
+        return df
+
+    def drinking_counts(self, year, state_id=None, min_age=None, max_age=None, sex=None, by_state=False):
+        df = self.filter_persons(self.load_merged(year), state_id)
+        # broj zapisa države prije filtera po dobi i spolu
+        state_total = len(df)
+        df = self.filter_persons(df, min_age=min_age, max_age=max_age, sex=sex)
+
+        if by_state:
+            return df.groupby("STATE").agg(
+                total_accidents=pd.NamedAgg(column="ST_CASE", aggfunc="count"),
+                alcohol_accidents=pd.NamedAgg(column="DRINKING", aggfunc=lambda x: (x == 1).sum())
+            ).reset_index()
+
+        return pd.DataFrame([{
+            "total_accidents": len(df),
+            "alcohol_accidents": int((df["DRINKING"] == 1).sum()),
+            "state_total": state_total
+        }])
+
+    def alcohol_persons(self, year, state_id=None, min_age=None, max_age=None, sex=None):
+        df = self.filter_persons(self.load_merged(year), state_id, min_age, max_age, sex)
+        return df.loc[df["DRINKING"] == 1, PROFILE_COLS].copy()
+
+
+class DuckDBBackend:
+    # Spajanje, filtriranje i agregacija izvršavaju se u DuckDB-u direktno nad
+    # CSV/Parquet datotekama, bez učitavanja cijelih tablica u pandas
+    def __init__(self, base_folder, database=":memory:"):
+        try:
+            import duckdb
+        except ImportError:
+            raise ImportError("DATA_BACKEND=duckdb requires the duckdb package (pip install duckdb)")
+
+        self.duckdb = duckdb
+        self.base_folder = base_folder
+        self.con = duckdb.connect(database)
+        # Starije godine nisu u UTF-8; encoding i kolone se za svaku datoteku određuju jednom
+        self.encodings = {}
+        self.columns_cache = {}
+        self.cache_lock = threading.Lock()
+
+    def years(self):
+        return list_years(self.base_folder)
+
+    def table_source(self, year, table):
+        path = find_table_path(self.base_folder, year, table)
+        if path is None:
+            raise DataUnavailable(f"Data for year {year} not found.")
+
+        quoted = path.replace("'", "''")
+        if path.endswith(".parquet"):
+            return f"read_parquet('{quoted}')"
+        encoding = self.csv_encoding(path)
+        # sve kao tekst, pretvorba ide kroz int_col, pa miješane kolone ne ruše upit
+        return f"read_csv('{quoted}', header=true, all_varchar=true, encoding='{encoding}')"
+
+    def csv_encoding(self, path):
+        with self.cache_lock:
+            encoding = self.encodings.get(path)
+        if encoding is None:
+            # čitanje cijele datoteke ide izvan locka, da ne blokira upite nad drugim datotekama
+            encoding = detect_csv_encoding(path)
+            with self.cache_lock:
+                encoding = self.encodings.setdefault(path, encoding)
+        return encoding
+
+    def columns(self, year, table):
+        path = find_table_path(self.base_folder, year, table)
+        if path is None:
+            return None
+
+        with self.cache_lock:
+            cols = self.columns_cache.get(path)
+        if cols is None:
+            rows = self.query(f"DESCRIBE SELECT * FROM {self.table_source(year, table)}", [])
+            cols = [col.replace('\ufeff', '') for col in rows["column_name"]]
+            with self.cache_lock:
+                cols = self.columns_cache.setdefault(path, cols)
+        return cols
+
+    def query(self, sql, params):
+        # FastAPI poziva endpointe iz više threadova, pa svaki upit dobiva svoj cursor
+        try:
+            with self.con.cursor() as cursor:
+                return cursor.execute(sql, params).df()
+        except self.duckdb.Error as e:
+            # neispravne ili nečitljive datoteke se tretiraju isto kao u pandas backendu
+            print(f"DuckDB query failed: {e}")
+            raise DataUnavailable(str(e))
+
+    def merged_source(self, year):
+        accident_cols = self.columns(year, "ACCIDENT")
+        person_cols = self.columns(year, "PERSON")
+        if accident_cols is None or person_cols is None:
+            raise DataUnavailable(f"Data for year {year} not found.")
+        if "ST_CASE" not in accident_cols or "ST_CASE" not in person_cols:
+            raise DataUnavailable(f"ST_CASE column missing for year {year}.")
+        if "STATE" not in accident_cols:
+            raise DataUnavailable(f"STATE column missing in ACCIDENT data for {year}.")
+        if "DRINKING" not in person_cols:
+            raise DataUnavailable(f"DRINKING column missing for year {year}.")
+
+        return (
+            f"{self.table_source(year, 'ACCIDENT')} a "
+            f"JOIN {self.table_source(year, 'PERSON')} p ON {int_col('a', 'ST_CASE')} = {int_col('p', 'ST_CASE')}"
+        )
+
+    def where_clause(self, state_id=None, min_age=None, max_age=None, sex=None):
+        conditions, params = self.person_conditions(min_age, max_age, sex)
+        if state_id is not None:
+            conditions.insert(0, f"{int_col('a', 'STATE')} = ?")
+            params.insert(0, state_id)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        return where, params
+
+    def person_conditions(self, min_age=None, max_age=None, sex=None):
+        conditions = []
+        params = []
+        if min_age is not None:
+            conditions.append(f"{int_col('p', 'AGE')} >= ?")
+            params.append(min_age)
+        if max_age is not None:
+            conditions.append(f"{int_col('p', 'AGE')} <= ?")
+            params.append(max_age)
+        if sex is not None:
+            conditions.append(f"{int_col('p', 'SEX')} = ?")
+            params.append(sex)
+        return conditions, params
+
+    def drinking_counts(self, year, state_id=None, min_age=None, max_age=None, sex=None, by_state=False):
+        source = self.merged_source(year)
+
+        if by_state:
+            where, params = self.where_clause(state_id, min_age, max_age, sex)
+            state = int_col('a', 'STATE')
+            counts = (
+                "COUNT(*) AS total_accidents, "
+                f"COUNT(*) FILTER (WHERE {int_col('p', 'DRINKING')} = 1) AS alcohol_accidents"
+            )
+            sql = f"SELECT {state} AS STATE, {counts} FROM {source} {where} GROUP BY {state} ORDER BY {state}"
+            return self.query(sql, params)
+
+        # filteri po dobi i spolu idu u FILTER, da state_total ostane broj zapisa cijele države
+        where, state_params = self.where_clause(state_id)
+        conditions, person_params = self.person_conditions(min_age, max_age, sex)
+        person_filter = " AND ".join(conditions) if conditions else "TRUE"
+        counts = (
+            f"COUNT(*) FILTER (WHERE {person_filter}) AS total_accidents, "
+            f"COUNT(*) FILTER (WHERE {person_filter} AND {int_col('p', 'DRINKING')} = 1) AS alcohol_accidents, "
+            "COUNT(*) AS state_total"
+        )
+        sql = f"SELECT {counts} FROM {source} {where}"
+        return self.query(sql, person_params + person_params + state_params)
+
+    def alcohol_persons(self, year, state_id=None, min_age=None, max_age=None, sex=None):
+        source = self.merged_source(year)
+        where, params = self.where_clause(state_id, min_age, max_age, sex)
+        drinking = f"{int_col('p', 'DRINKING')} = 1"
+        where = f"{where} AND {drinking}" if where else f"WHERE {drinking}"
+        selected = ", ".join(
+            f"{int_col(alias, col)} AS {col}"
+            for alias, col in (("p", "SEX"), ("p", "AGE"), ("a", "MONTH"), ("a", "HOUR"))
+        )
+        sql = f"SELECT {selected} FROM {source} {where}"
+        return self.query(sql, params)
+
+
+def create_backend(base_folder, name=None):
+    name = (name or os.environ.get("DATA_BACKEND", "pandas")).lower()
+    if name == "pandas":
+        return PandasBackend(base_folder)
+    if name == "duckdb":
+        return DuckDBBackend(base_folder)
+    raise ValueError(f"Unknown DATA_BACKEND: {name} (expected 'pandas' or 'duckdb')")
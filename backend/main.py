@@ -1,9 +1,12 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
 import os
 import pandas as pd
 import json
 import hashlib
+import tempfile
+from data_backend import DataUnavailable, create_backend
 
 def generate_filtered_cache_key(state_id: int, min_age: int = None, max_age: int = None, sex: int = None) -> str:
     # Normaliziraj vrijednosti (npr. pretvori None u "null")
@@ -35,6 +38,9 @@ NATIONAL_TREND_CACHE_PATH = os.path.join(BASE_FOLDER, "national_trend.json")
 STATE_TREND_CACHE_FOLDER = os.path.join(BASE_FOLDER, "state_trend_cache")
 os.makedirs(STATE_TREND_CACHE_FOLDER, exist_ok=True)
 
+# pandas (zadano) ili duckdb, bira se varijablom okoline DATA_BACKEND
+data_backend = create_backend(BASE_FOLDER)
+
 state_name_map = {
         1: "Alabama", 2: "Alaska", 4: "Arizona", 5: "Arkansas", 6: "California",
         8: "Colorado", 9: "Connecticut", 10: "Delaware", 11: "District of Columbia",
@@ -116,6 +122,24 @@ def load_risk_profile_cache(state_id, year, min_age, max_age, sex):
             return json.load(f)
     return None
 
+HEATMAP_CACHE_FOLDER = os.path.join(BASE_FOLDER, "state_heatmap_cache")
+os.makedirs(HEATMAP_CACHE_FOLDER, exist_ok=True)
+
+def save_heatmap_cache(year, data):
+    path = os.path.join(HEATMAP_CACHE_FOLDER, f"{year}.json")
+    # stream i /api/state_heatmap/{year} mogu istovremeno računati istu godinu,
+    # pa se piše u privremenu datoteku i atomarno zamijeni
+    with tempfile.NamedTemporaryFile("w", dir=HEATMAP_CACHE_FOLDER, suffix=".tmp", delete=False) as f:
+        json.dump(data, f)
+    os.replace(f.name, path)
+
+def load_heatmap_cache(year):
+    path = os.path.join(HEATMAP_CACHE_FOLDER, f"{year}.json")
+    if os.path.exists(path):
+        with open(path, "r") as f:
+            return json.load(f)
+    return None
+
 @app.get("/api/check_required_columns")
 def check_required_columns():
     required_columns = {
@@ -124,84 +148,38 @@ def check_required_columns():
     }
     results = {}
 
-    for year_folder in os.listdir(BASE_FOLDER):
-        try:
-            year = int(year_folder)
-            year_path = os.path.join(BASE_FOLDER, str(year))
-
-            if os.path.isdir(year_path):
-                results[year] = {}
-
-                for csv_type, expected_cols in required_columns.items():
-                    csv_filename = f"{csv_type}.csv"
-                    file_path = os.path.join(year_path, csv_filename)
-
-                    if os.path.exists(file_path):
-                        try:
-                            df = pd.read_csv(file_path, nrows=0, encoding="utf-8-sig")
-                            available_cols = [col.replace('\ufeff', '') for col in df.columns.tolist()]
-
-                            found_cols = []
-                            missing_cols = []
-
-                            for col in expected_cols:
-                                if col in available_cols:
-                                    found_cols.append(col)
-                                else:
-                                    missing_cols.append(col)
-                            print(f"Missing columns for {year}: {missing_cols}")
-                            results[year][csv_type] = {
-                                "found": found_cols,
-                                "missing": missing_cols,
-                                "available_total": len(available_cols)
-                            }
-                        except Exception as e:
-                            results[year][csv_type] = {"error": str(e)}
-                    else:
-                        results[year][csv_type] = {"error": "File not found"}
-
-        except ValueError:
-            continue
-
-    return results
-
-
-def load_accident_and_person_data(year):
+    # iste datoteke (Parquet ili CSV) koje čitaju i upiti
+    for year in data_backend.years():
+        results[year] = {}
 
-    accident_path = os.path.join(BASE_FOLDER, str(year), "ACCIDENT.csv")
-    person_path = os.path.join(BASE_FOLDER, str(year), "PERSON.csv")
-
-    accident_df = None
-    person_df = None
+        for table, expected_cols in required_columns.items():
+            try:
+                available_cols = data_backend.columns(year, table)
+            except Exception as e:
+                results[year][table] = {"error": str(e)}
+                continue
+
+            if available_cols is None:
+                results[year][table] = {"error": "File not found"}
+                continue
+
+            found_cols = []
+            missing_cols = []
+
+            for col in expected_cols:
+                if col in available_cols:
+                    found_cols.append(col)
+                else:
+                    missing_cols.append(col)
+            print(f"Missing columns for {year}: {missing_cols}")
+            results[year][table] = {
+                "found": found_cols,
+                "missing": missing_cols,
+                "available_total": len(available_cols)
+            }
 
-    def load_csv_with_fallback(path):
-        if not os.path.exists(path):
-            return None
+    return results
 
-        try:
-            return pd.read_csv(path, encoding="utf-8-sig",  low_memory=False)
-        except UnicodeDecodeError:
-            try:
-                # Fallback na cp1252 (za starije godine)
-                return pd.read_csv(path, encoding="cp1252",  low_memory=False)
-            except Exception as e2:
-                print(f"Error loading {path} with both encodings: {e2}")
-                return None
-        except Exception as e:
-            print(f"Error loading {path}: {e}")
-            return None
-
-    # Učitaj ACCIDENT
-    accident_df = load_csv_with_fallback(accident_path)
-    if accident_df is not None:
-        print(f"Loaded ACCIDENT for {year}, shape: {accident_df.shape}")
-
-    # Učitaj PERSON
-    person_df = load_csv_with_fallback(person_path)
-    if person_df is not None:
-        print(f"Loaded PERSON for {year}, shape: {person_df.shape}")
-
-    return accident_df, person_df
 
 @app.get("/api/national_trend")
 def national_trend():
@@ -214,26 +192,14 @@ def national_trend():
     print("Cache not found, computing national trend...")
     trend_data = []
 
-    for year_folder in os.listdir(BASE_FOLDER):
+    for year in data_backend.years():
         try:
-            year = int(year_folder)
-        except ValueError:
+            counts = data_backend.drinking_counts(year).iloc[0]
+        except DataUnavailable:
             continue
 
-        accident_df, person_df = load_accident_and_person_data(year)
-        if accident_df is None or person_df is None:
-            continue
-
-        if 'ST_CASE' not in accident_df.columns or 'ST_CASE' not in person_df.columns:
-            continue
-
-        if 'DRINKING' not in person_df.columns:
-            continue
-
-        merged_df = pd.merge(accident_df, person_df, on='ST_CASE', how='inner')
-
-        total_records = len(merged_df)
-        alcohol_records = len(merged_df[merged_df["DRINKING"] == 1])
+        total_records = int(counts["total_accidents"])
+        alcohol_records = int(counts["alcohol_accidents"])
 
         percentage = round((alcohol_records / total_records) * 100, 2) if total_records > 0 else 0
 
@@ -251,36 +217,12 @@ def national_trend():
 
     return {"data": trend_data}
 
-@app.get("/api/state_heatmap/{year}")
-def state_heatmap(year: int):
-    accident_df, person_df = load_accident_and_person_data(year)
-    person_df = person_df.drop(columns=["STATE"], errors="ignore")
-
-    if accident_df is None or person_df is None:
-        return {"error": f"Data for year {year} not found."}
-
-    # Provjerimo postojeće kolone za državu
-    state_col = None
-    if "STATE" in accident_df.columns:
-        state_col = "STATE"
-    elif "STATE_x" in accident_df.columns:
-        state_col = "STATE_x"
-    else:
-        return {"error": "No STATE column found in ACCIDENT data."}
-
-    if "ST_CASE" not in accident_df.columns or "ST_CASE" not in person_df.columns:
-        return {"error": f"ST_CASE column missing for year {year}."}
-
-    if "DRINKING" not in person_df.columns:
-        return {"error": f"DRINKING column missing for year {year}."}
-
-    merged_df = pd.merge(accident_df, person_df, on="ST_CASE", how="inner")
-
-    # grupiraj po državi
-    state_group = merged_df.groupby(state_col).agg(
-        total_accidents=pd.NamedAgg(column="ST_CASE", aggfunc="count"),
-        alcohol_accidents=pd.NamedAgg(column="DRINKING", aggfunc=lambda x: (x == 1).sum())
-    ).reset_index()
+def compute_state_heatmap(year):
+    try:
+        # grupiraj po državi
+        state_group = data_backend.drinking_counts(year, by_state=True)
+    except DataUnavailable as e:
+        return {"error": str(e)}
 
     # izračun postotka
     state_group['percentage'] = round((state_group['alcohol_accidents'] / state_group['total_accidents']) * 100, 2)
@@ -291,14 +233,58 @@ def state_heatmap(year: int):
 
     state_group['difference'] = round(state_group['percentage'] - national_avg, 2)
     state_group['national_avg'] = national_avg
-    state_group['state_name'] = state_group[state_col].map(state_name_map)
+    state_group['state_name'] = state_group["STATE"].map(state_name_map)
 
 
     # mapiraj u listu dictova za JSON
-    result = state_group.rename(columns={state_col: "state"}).to_dict(orient="records")
+    result = state_group.rename(columns={"STATE": "state"}).to_dict(orient="records")
+
+    return result
+
+def get_state_heatmap(year):
+    # prvo probaj učitati cache, računaj samo ako ga nema
+    cached = load_heatmap_cache(year)
+    if cached is not None:
+        return cached
 
+    result = compute_state_heatmap(year)
+    # greške se ne spremaju, da se izračun ponovi kad podaci budu dostupni
+    if isinstance(result, list):
+        save_heatmap_cache(year, result)
     return result
 
+@app.get("/api/state_heatmap/{year}")
+def state_heatmap(year: int):
+    return get_state_heatmap(year)
+
+@app.get("/api/state_heatmap_stream")
+def state_heatmap_stream(start_year: int = None, end_year: int = None, first_year: int = None):
+    # sve godine kroz jednu vezu, jedna JSON linija po godini (NDJSON)
+    years = [
+        y for y in data_backend.years()
+        if (start_year is None or y >= start_year) and (end_year is None or y <= end_year)
+    ]
+    # godina koju klijent trenutno prikazuje ide prva, ostale redom
+    if first_year in years:
+        years.remove(first_year)
+        years.insert(0, first_year)
+
+    def generate():
+        for year in years:
+            try:
+                result = get_state_heatmap(year)
+            except Exception as e:
+                print(f"Error computing heatmap for {year}: {e}")
+                result = {"error": str(e)}
+
+            if isinstance(result, dict) and "error" in result:
+                line = {"year": year, "error": result["error"]}
+            else:
+                line = {"year": year, "data": result}
+            yield json.dumps(line) + "\n"
+
+    return StreamingResponse(generate(), media_type="application/x-ndjson")
+
 
 @app.get("/api/state_trend/{state_id}")
 def state_trend(state_id: str):
@@ -309,22 +295,14 @@ def state_trend(state_id: str):
 
     results = []
 
-    for year_folder in os.listdir(BASE_FOLDER):
+    for year in data_backend.years():
         try:
-            year = int(year_folder)
-        except ValueError:
-            continue
-
-        accident_df, person_df = load_accident_and_person_data(year)
-        if accident_df is None or person_df is None:
+            counts = data_backend.drinking_counts(year, state_id=int(state_id)).iloc[0]
+        except DataUnavailable:
             continue
 
-        person_df = person_df.drop(columns=["STATE"], errors="ignore")
-        merged_df = pd.merge(accident_df, person_df, on="ST_CASE", how="inner")
-
-        state_df = merged_df[merged_df["STATE"] == int(state_id)]
-        total_records = len(state_df)
-        alcohol_records = len(state_df[state_df["DRINKING"] == 1])
+        total_records = int(counts["total_accidents"])
+        alcohol_records = int(counts["alcohol_accidents"])
         percentage = round((alcohol_records / total_records) * 100, 2) if total_records > 0 else 0
 
         results.append({
@@ -344,18 +322,10 @@ def state_trend(state_id: str):
 
 @app.get("/api/national_risk_profile/{year}")
 def national_risk_profile(year: int):
-    accident_df, person_df = load_accident_and_person_data(year)
-    if accident_df is None or person_df is None:
-        return {"error": f"Data for year {year} not found."}
-
-    conflicting_cols = ["MONTH", "HOUR", "STATE", "YEAR", "DAY"]
-    for col in conflicting_cols:
-        if col in person_df.columns:
-            person_df = person_df.drop(columns=[col])
-
-    # Spoji podatke
-    merged_df = pd.merge(accident_df, person_df, on="ST_CASE", how="inner")
-    alcohol_df = merged_df[merged_df["DRINKING"] == 1]
+    try:
+        alcohol_df = data_backend.alcohol_persons(year)
+    except DataUnavailable as e:
+        return {"error": str(e)}
 
     if len(alcohol_df) == 0:
         return {"error": f"No alcohol-related fatalities found for {year}."}
@@ -439,45 +409,10 @@ def state_risk_profile(
 
     print(f"Computing risk profile for state {state_id}, year {year}, filters: age=[{min_age}, {max_age}], sex={sex}")
 
-    accident_df, person_df = load_accident_and_person_data(year)
-    if accident_df is None or person_df is None:
-        return {"error": f"Data for year {year} not found."}
-
-    if "STATE" not in accident_df.columns:
-        return {"error": f"STATE column missing in ACCIDENT data for {year}."}
-
-    conflicting_cols = ["MONTH", "HOUR", "STATE", "YEAR", "DAY"]
-    for col in conflicting_cols:
-        if col in person_df.columns:
-            person_df = person_df.drop(columns=[col])
-
-    merged_df = pd.merge(accident_df, person_df, on="ST_CASE", how="inner")
-    state_filtered = merged_df[merged_df["STATE"] == state_id]
-
-    if len(state_filtered) == 0:
-        result = {
-            "year": year,
-            "state_id": state_id,
-            "state_name": state_name_map.get(state_id, f"State {state_id}"),
-            "total_alcohol_fatalities": 0,
-            "by_sex": {"male": 0, "female": 0},
-            "by_age_group": {},
-            "by_month": {},
-            "by_time_of_day": {},
-            "applied_filters": {"min_age": min_age, "max_age": max_age, "sex": sex}
-        }
-        save_risk_profile_cache(state_id, year, min_age, max_age, sex, result)
-        return result
-
-    filtered_df = state_filtered.copy()
-    if min_age is not None:
-        filtered_df = filtered_df[filtered_df["AGE"] >= min_age]
-    if max_age is not None:
-        filtered_df = filtered_df[filtered_df["AGE"] <= max_age]
-    if sex is not None:
-        filtered_df = filtered_df[filtered_df["SEX"] == sex]
-
-    alcohol_df = filtered_df[filtered_df["DRINKING"] == 1]
+    try:
+        alcohol_df = data_backend.alcohol_persons(year, state_id, min_age, max_age, sex)
+    except DataUnavailable as e:
+        return {"error": str(e)}
 
     if len(alcohol_df) == 0:
         result = {
@@ -572,39 +507,17 @@ def state_trend_filtered(
     print(f"Computing filtered trend for state {state_id} with filters: age=[{min_age}, {max_age}], sex={sex}")
     trend_data = []
 
-    for year_folder in os.listdir(BASE_FOLDER):
+    for year in data_backend.years():
         try:
-            year = int(year_folder)
-        except ValueError:
-            continue
-
-        accident_df, person_df = load_accident_and_person_data(year)
-        if accident_df is None or person_df is None:
-            continue
-
-        # Ukloni sukobljene kolone
-        conflicting_cols = ["MONTH", "HOUR", "STATE", "YEAR", "DAY"]
-        for col in conflicting_cols:
-            if col in person_df.columns:
-                person_df = person_df.drop(columns=[col])
-
-        merged_df = pd.merge(accident_df, person_df, on="ST_CASE", how="inner")
-        state_df = merged_df[merged_df["STATE"] == state_id]
-
-        if len(state_df) == 0:
+            counts = data_backend.drinking_counts(year, state_id, min_age, max_age, sex).iloc[0]
+            # godine u kojima država nema nijednog zapisa se preskaču
+            if counts["state_total"] == 0:
+                continue
+        except DataUnavailable:
             continue
 
-        filtered_df = state_df.copy()
-        if min_age is not None:
-            filtered_df = filtered_df[filtered_df["AGE"] >= min_age]
-        if max_age is not None:
-            filtered_df = filtered_df[filtered_df["AGE"] <= max_age]
-        if sex is not None:
-            filtered_df = filtered_df[filtered_df["SEX"] == sex]
-
-        alcohol_df = filtered_df[filtered_df["DRINKING"] == 1]
-        alcohol_records = len(alcohol_df)
-        total_records = len(filtered_df)
+        alcohol_records = int(counts["alcohol_accidents"])
+        total_records = int(counts["total_accidents"])
         percentage = round((alcohol_records / total_records) * 100, 2) if total_records > 0 else 0
 
         trend_data.append({
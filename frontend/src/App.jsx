@@ -1,6 +1,6 @@
 // src/App.js
 
-import { useState, useEffect } from 'react';
+import { useState, useEffect, useRef } from 'react';
 import './App.css';
 import NationalTrendChart from './components/NationalTrendChart';
 import USHeatMap from './components/USHeatMap';
@@ -12,8 +12,11 @@ import StateTrendPage from './components/StateTrendPage';
 function App() {
   const [trendData, setTrendData] = useState([]);
   const [heatmapData, setHeatmapData] = useState(null);
+  const heatmapByYear = useRef({});
+  const [heatmapStreamDone, setHeatmapStreamDone] = useState(false);
   const [riskProfile, setRiskProfile] = useState(null);
   const [year, setYear] = useState(2023);
+  const selectedYear = useRef(year);
   const [heatmapType, setHeatmapType] = useState("percentage");
   const [selectedStatesIds, setSelectedStatesIds] = useState([]);
   const [statesData, setStatesData] = useState([]);
@@ -35,18 +38,77 @@ function App() {
   }, []);
 
   useEffect(() => {
+    // sve godine heatmape stižu kroz jednu vezu, redom kako su izračunate
+    const controller = new AbortController();
+    const streamHeatmapData = async () => {
+      try {
+        // odabrana godina stiže prva, ostale redom
+        const response = await fetch(
+          `http://127.0.0.1:8000/api/state_heatmap_stream?first_year=${selectedYear.current}`,
+          { signal: controller.signal }
+        );
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = "";
+        while (true) {
+          const { done, value } = await reader.read();
+          if (done) break;
+          buffer += decoder.decode(value, { stream: true });
+          const lines = buffer.split("\n");
+          buffer = lines.pop();
+          for (const line of lines) {
+            if (!line.trim()) continue;
+            const item = JSON.parse(line);
+            if (item.data) {
+              heatmapByYear.current[item.year] = item.data;
+              // odabrana godina se možda još učitava, prikaži je odmah
+              if (item.year === selectedYear.current) {
+                setHeatmapData(item.data);
+              }
+            } else if (item.year === selectedYear.current) {
+              setHeatmapData({ error: item.error });
+            }
+          }
+        }
+      } catch (error) {
+        if (error.name !== "AbortError") {
+          console.error("Error streaming heatmap:", error);
+        }
+      } finally {
+        // nakon streama godine koje nisu stigle dohvaćaju se pojedinačno
+        if (!controller.signal.aborted) {
+          setHeatmapStreamDone(true);
+        }
+      }
+    };
+    streamHeatmapData();
+    return () => controller.abort();
+  }, []);
+
+  useEffect(() => {
+    selectedYear.current = year;
+    const cached = heatmapByYear.current[year];
+    if (cached) {
+      setHeatmapData(cached);
+      return;
+    }
     setHeatmapData(null);
+    // dok je stream otvoren, odabrana godina stiže kroz njega
+    if (!heatmapStreamDone) return;
     const fetchHeatmapData = async () => {
       try {
         const response = await fetch(`http://127.0.0.1:8000/api/state_heatmap/${year}`);
         const result = await response.json();
-        setHeatmapData(result || []);
+        // korisnik je u međuvremenu možda odabrao drugu godinu
+        if (selectedYear.current === year) {
+          setHeatmapData(result || []);
+        }
       } catch (error) {
         console.error("Error fetching heatmap:", error);
       }
     };
     fetchHeatmapData();
-  }, [year]);
+  }, [year, heatmapStreamDone]);
 
   useEffect(() => {
     const fetchRiskProfile = async () => {